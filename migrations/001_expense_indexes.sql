@@ -0,0 +1,19 @@
+-- Indexes backing the dashboard's expense filters (see _expense_filters in streamlit_app_supabase.py).
+-- Idempotent; run once per database, e.g. `psql "$DATABASE_URL" -f migrations/001_expense_indexes.sql`
+-- or paste into the Supabase SQL editor.
+
+-- date range: expense_date BETWEEN start AND end
+CREATE INDEX IF NOT EXISTS expenses_date_idx ON expenses (expense_date);
+
+-- company filter combined with the date range
+CREATE INDEX IF NOT EXISTS expenses_company_date_idx ON expenses (company_id, expense_date);
+
+-- status filter; paid rows are the bulk of the table and are left out
+CREATE INDEX IF NOT EXISTS expenses_status_idx ON expenses (status) WHERE status <> 'تم الصرف';
+
+-- free-text search: ILIKE '%term%' over EXPENSE_SEARCH_TEXT, which this expression must match exactly
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE INDEX IF NOT EXISTS expenses_search_trgm_idx ON expenses USING gin (
+    (coalesce(expense_number, '') || chr(1) || coalesce(amount_raw, '') || chr(1) || coalesce(amount::text, ''))
+    gin_trgm_ops
+);
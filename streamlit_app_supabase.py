@@ -1,82 +1,273 @@
 """
 Streamlit dashboard for managing cafe expenses and sales (Supabase / Postgres).
+
+The indexes the dashboard's filters rely on are in migrations/ and are applied once per database.
 """
 
 import os
+import contextlib
 import datetime
+import io
+import itertools
+import threading
+import numpy as np
 import pandas as pd
 import psycopg2
 import psycopg2.extras
+import psycopg2.pool
 import streamlit as st
-import matplotlib.pyplot as plt
 
 
 # ---------- DB CONNECTION ----------
-def get_connection():
-    """Connect to Postgres using Streamlit Secrets (fallback to env)."""
+@st.cache_resource
+def get_pool():
+    """Build a connection pool from Streamlit Secrets (fallback to env), shared across reruns.
+
+    PGPOOL_MAX caps the open connections (default 5); borrowers beyond that wait for a free one.
+    """
     host = st.secrets.get("PGHOST") or os.environ.get("PGHOST")
     port = st.secrets.get("PGPORT") or os.environ.get("PGPORT", 5432)
     database = st.secrets.get("PGDATABASE") or os.environ.get("PGDATABASE")
     user = st.secrets.get("PGUSER") or os.environ.get("PGUSER")
     password = st.secrets.get("PGPASSWORD") or os.environ.get("PGPASSWORD")
     sslmode = st.secrets.get("SSLMODE") or os.environ.get("SSLMODE", "require")
+    maxconn = int(st.secrets.get("PGPOOL_MAX") or os.environ.get("PGPOOL_MAX", 5))
 
-    conn = psycopg2.connect(
+    return psycopg2.pool.ThreadedConnectionPool(
+        1,
+        maxconn,
         host=host,
         port=port,
         database=database,
         user=user,
         password=password,
         sslmode=sslmode,
-        cursor_factory=psycopg2.extras.RealDictCursor,
     )
-    return conn
+
+
+@st.cache_resource
+def get_pool_slots():
+    """One slot per pooled connection: getconn() raises instead of waiting once the pool is exhausted."""
+    return threading.BoundedSemaphore(get_pool().maxconn)
+
+
+def _getconn_alive(pool):
+    """Take a pooled connection, replacing any whose socket the server dropped while it sat idle."""
+    # psycopg2 only notices a dropped socket when an operation fails, so probe before handing it out;
+    # every idle connection may be dead (e.g. overnight), hence one attempt more than the pool holds
+    for attempt in range(pool.maxconn + 1):
+        conn = pool.getconn()
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1;")
+            return conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            pool.putconn(conn, close=True)
+            if attempt == pool.maxconn:
+                raise
+
+
+@contextlib.contextmanager
+def get_connection():
+    """Borrow a pooled connection; the block runs in one transaction (commit on success)."""
+    pool = get_pool()
+    slots = get_pool_slots()
+    with slots:
+        conn = _getconn_alive(pool)
+        try:
+            with conn:
+                yield conn
+        finally:
+            pool.putconn(conn, close=bool(conn.closed))
 
 
 # ---------- DATA IO ----------
+# NUMERIC amounts are cast to float8 in SQL: psycopg2 would hand them over as Decimal objects
+EXPENSE_COLUMNS = (
+    "id, expense_number, amount::float8 AS amount, amount_raw, company_id, status, expense_date, month, year"
+)
+# one searchable string per row, so a search term is matched in a single ILIKE pass;
+# fields are joined with chr(1), which users cannot type, so a term never matches across two fields
+EXPENSE_SEARCH_TEXT = (
+    "(coalesce(expense_number, '') || chr(1) || coalesce(amount_raw, '') || chr(1) || coalesce(amount::text, ''))"
+)
+
+
+def _fetch_df(query: str, params=None, stream: bool = False) -> pd.DataFrame:
+    """Run a read query on a pooled connection and return the rows as a DataFrame."""
+    # stream=True: server-side (named) cursor, rows arrive in itersize batches instead of
+    # libpq buffering the whole result before pandas copies it
+    with get_connection() as conn, conn.cursor(name="fetch_df" if stream else None) as cur:
+        cur.itersize = 10000
+        cur.execute(query, params)
+        rows = iter(cur)
+        # named cursors only report their columns after the first fetch
+        first = next(rows, None)
+        columns = [d.name for d in cur.description]
+        records = itertools.chain([first], rows) if first is not None else []
+        # plain tuple rows, fed straight from the cursor: no per-row dict
+        return pd.DataFrame.from_records(records, columns=columns)
+
+
+def _expense_filters(
+    start: datetime.date,
+    end: datetime.date,
+    company_id: int | None,
+    status: str | None,
+    search: str | None,
+) -> tuple[str, dict]:
+    """WHERE clause and params for the explorer filters; None means "no filter"."""
+    where = (
+        "expense_date BETWEEN %(start)s AND %(end)s"
+        " AND (%(company_id)s::int IS NULL OR company_id = %(company_id)s)"
+        " AND (%(status)s::text IS NULL OR status = %(status)s)"
+        f" AND (%(search)s::text IS NULL OR {EXPENSE_SEARCH_TEXT} ILIKE %(pattern)s)"
+    )
+    # match the term literally: escape LIKE wildcards typed by the user
+    escaped = (search or "").replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    params = {
+        "start": start,
+        "end": end,
+        "company_id": company_id,
+        "status": status,
+        "search": search,
+        "pattern": f"%{escaped}%",
+    }
+    return where, params
+
+
+@st.cache_data(ttl=300)
+def load_companies() -> pd.DataFrame:
+    """Load companies ordered by name."""
+    return _fetch_df("SELECT id, name FROM companies ORDER BY name;")
+
+
+@st.cache_data(ttl=300)
+def load_company_ids() -> dict[str, int]:
+    """Map company name -> id, to resolve selectbox choices without scanning the frame."""
+    companies = load_companies()
+    return {name: int(company_id) for name, company_id in zip(companies["name"], companies["id"])}
+
+
+@st.cache_data(ttl=300)
+def load_sales() -> pd.DataFrame:
+    """Load monthly sales and do minimal typing."""
+    sales = _fetch_df("SELECT month, year, coalesce(amount, 0)::float8 AS amount FROM sales ORDER BY year, month;")
+    sales["year"] = pd.to_numeric(sales["year"], errors="coerce").fillna(0).astype(int)
+    sales["month"] = pd.to_numeric(sales["month"], errors="coerce").fillna(0).astype(int)
+    # int yyyymm key, built once per cache fill: merges as a plain int64 hash join
+    sales["period"] = sales["year"] * 100 + sales["month"]
+    return sales
+
+
+@st.cache_data(ttl=300)
+def load_expense_bounds() -> dict:
+    """Row count and date span of expenses, used for the explorer defaults."""
+    bounds = _fetch_df(
+        "SELECT COUNT(*) AS n, MIN(expense_date) AS min_date, MAX(expense_date) AS max_date FROM expenses;"
+    )
+    return bounds.iloc[0].to_dict()
+
+
+@st.cache_data(ttl=300)
+def load_statuses() -> list[str]:
+    """Distinct expense statuses, sorted."""
+    statuses = _fetch_df("SELECT DISTINCT status FROM expenses WHERE status IS NOT NULL ORDER BY status;")
+    return statuses["status"].tolist()
+
+
 @st.cache_data(ttl=300)
-def load_data():
-    """Load companies, expenses, sales from DB and do minimal typing."""
-    conn = get_connection()
-    dfs = {}
-    with conn.cursor() as cur:
-        # companies
-        cur.execute("SELECT * FROM companies ORDER BY name;")
-        dfs["companies"] = pd.DataFrame(cur.fetchall())
-
-        # expenses
-        cur.execute("SELECT * FROM expenses ORDER BY id;")
-        expenses = pd.DataFrame(cur.fetchall())
-        if not expenses.empty:
-            expenses["amount"] = pd.to_numeric(expenses["amount"], errors="coerce")
-            # ensure date column is datetime.date
-            expenses["expense_date"] = pd.to_datetime(
-                expenses["expense_date"], errors="coerce"
-            ).dt.date
-        dfs["expenses"] = expenses
-
-        # sales
-        cur.execute("SELECT * FROM sales ORDER BY year, month;")
-        sales = pd.DataFrame(cur.fetchall())
-        if not sales.empty:
-            sales["amount"] = pd.to_numeric(sales["amount"], errors="coerce").fillna(0)
-            sales["year"] = pd.to_numeric(sales["year"], errors="coerce").fillna(0).astype(int)
-            sales["month"] = pd.to_numeric(sales["month"], errors="coerce").fillna(0).astype(int)
-            sales["period"] = sales["year"].astype(str) + "-" + sales["month"].astype(str).str.zfill(2)
-        dfs["sales"] = sales
-    conn.close()
-    return dfs
+def load_expenses(
+    start: datetime.date,
+    end: datetime.date,
+    company_id: int | None = None,
+    status: str | None = None,
+    search: str | None = None,
+) -> pd.DataFrame:
+    """Load only the expenses matching the explorer filters."""
+    where, params = _expense_filters(start, end, company_id, status, search)
+    expenses = _fetch_df(f"SELECT {EXPENSE_COLUMNS} FROM expenses WHERE {where} ORDER BY id;", params, stream=True)
+    expenses["expense_date"] = pd.to_datetime(expenses["expense_date"])
+    # Arrow-backed strings: one contiguous buffer per column instead of a Python str per cell
+    expenses = expenses.astype({"expense_number": "string[pyarrow]", "amount_raw": "string[pyarrow]"})
+    # low-cardinality columns: comparisons run on integer codes, and the cache entry shrinks
+    expenses["status"] = expenses["status"].astype("category")
+    # via nullable Int64, so rows without a company don't turn the ids into floats
+    expenses["company_id"] = expenses["company_id"].astype("Int64").astype("category")
+    return expenses
+
+
+@st.cache_data(ttl=300)
+def expenses_csv(
+    start: datetime.date,
+    end: datetime.date,
+    company_id: int | None = None,
+    status: str | None = None,
+    search: str | None = None,
+) -> bytes:
+    """CSV export of load_expenses(), serialized once per filter set rather than on every rerun."""
+    buf = io.BytesIO()
+    load_expenses(start, end, company_id, status, search).to_csv(buf, index=False)
+    return buf.getvalue()
+
+
+@st.cache_data(ttl=300)
+def summary_by_month(
+    start: datetime.date,
+    end: datetime.date,
+    company_id: int | None = None,
+    status: str | None = None,
+    search: str | None = None,
+) -> pd.DataFrame:
+    """Monthly expense totals for the explorer filters, aggregated in Postgres."""
+    where, params = _expense_filters(start, end, company_id, status, search)
+    summary = _fetch_df(
+        f"""
+        SELECT year::int AS year, month::int AS month, SUM(amount)::float8 AS amount
+        FROM expenses
+        WHERE {where} AND year IS NOT NULL AND month IS NOT NULL
+        GROUP BY 1, 2
+        ORDER BY 1, 2;
+        """,
+        params,
+    )
+    # same int yyyymm key as load_sales(), formatted only for display
+    summary["period"] = summary["year"] * 100 + summary["month"]
+    return summary
+
+
+@st.cache_data(ttl=300)
+def summary_by_company(
+    start: datetime.date,
+    end: datetime.date,
+    company_id: int | None = None,
+    status: str | None = None,
+    search: str | None = None,
+) -> pd.DataFrame:
+    """Per-company expense totals for the explorer filters, largest first."""
+    where, params = _expense_filters(start, end, company_id, status, search)
+    return _fetch_df(
+        f"""
+        SELECT s.company_id, c.name, s.amount
+        FROM (
+            SELECT company_id, SUM(amount)::float8 AS amount
+            FROM expenses
+            WHERE {where} AND company_id IS NOT NULL
+            GROUP BY company_id
+        ) s
+        LEFT JOIN companies c ON c.id = s.company_id
+        ORDER BY s.amount DESC NULLS LAST;
+        """,
+        params,
+    )
 
 
 def insert_company(name: str) -> None:
-    conn = get_connection()
-    with conn.cursor() as cur:
+    with get_connection() as conn, conn.cursor() as cur:
         cur.execute(
             "INSERT INTO companies (name) VALUES (%s) ON CONFLICT (name) DO NOTHING;",
             (name,),
         )
-        conn.commit()
-    conn.close()
 
 
 def insert_expense(
@@ -87,31 +278,29 @@ def insert_expense(
     status: str,
     date: datetime.date,
 ) -> None:
-    conn = get_connection()
-    with conn.cursor() as cur:
-        cur.execute(
+    insert_expenses_bulk([(expense_number, amount, amount_raw, company_id, status, date)])
+
+
+def insert_expenses_bulk(rows) -> None:
+    """Insert many (expense_number, amount, amount_raw, company_id, status, date) rows in one transaction."""
+    values = [
+        (expense_number, amount, amount_raw, company_id, status, date, date.month, date.year)
+        for expense_number, amount, amount_raw, company_id, status, date in rows
+    ]
+    with get_connection() as conn, conn.cursor() as cur:
+        psycopg2.extras.execute_values(
+            cur,
             """
             INSERT INTO expenses (expense_number, amount, amount_raw, company_id, status, expense_date, month, year)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s);
+            VALUES %s;
             """,
-            (
-                expense_number,
-                amount,
-                amount_raw,
-                company_id,
-                status,
-                date,
-                date.month,
-                date.year,
-            ),
+            values,
+            page_size=1000,
         )
-        conn.commit()
-    conn.close()
 
 
 def upsert_sales(month: int, year: int, amount: float) -> None:
-    conn = get_connection()
-    with conn.cursor() as cur:
+    with get_connection() as conn, conn.cursor() as cur:
         cur.execute(
             """
             INSERT INTO sales (month, year, amount)
@@ -120,53 +309,55 @@ def upsert_sales(month: int, year: int, amount: float) -> None:
             """,
             (month, year, amount),
         )
-        conn.commit()
-    conn.close()
 
 
 # ---------- APP ----------
+def _format_periods(periods: pd.Series) -> list[str]:
+    """Render int yyyymm period keys as 'YYYY-MM' labels."""
+    return [f"{p // 100}-{p % 100:02d}" for p in periods]
+
+
 def main():
     st.set_page_config(page_title="لوحة تحكم المقهي", layout="wide")
     st.title("لوحة تحكم المصروفات والمبيعات للمقهي")
 
+    # fetched once per run and shared by the sidebar form and the explorer filters
+    company_ids = load_company_ids()
+    status_options = load_statuses()
+
     # Sidebar: create
     st.sidebar.header("إضافة بيانات جديدة")
 
-    with st.sidebar.expander("إضافة شركة"):
+    # forms: typing in the sidebar doesn't rerun the app until the entry is submitted
+    with st.sidebar.expander("إضافة شركة"), st.form("add_company"):
         new_company_name = st.text_input("اسم الشركة الجديدة")
-        if st.button("إضافة الشركة") and new_company_name.strip():
+        if st.form_submit_button("إضافة الشركة") and new_company_name.strip():
             insert_company(new_company_name.strip())
             st.success("تم إضافة الشركة بنجاح")
+            # a write invalidates every cached query; reload the lookups before the forms below
+            # and the explorer are drawn, so they already offer the new entry in this run
             st.cache_data.clear()
+            company_ids = load_company_ids()
+            status_options = load_statuses()
 
-    with st.sidebar.expander("إضافة مصروف"):
-        dfs_now = load_data()
-        company_names = dfs_now["companies"]
+    with st.sidebar.expander("إضافة مصروف"), st.form("add_expense"):
         expense_number = st.text_input("رقم الصرف")
         amount_raw = st.text_input("المبلغ (نصي)")
         amount_val = st.number_input("المبلغ (رقمي)", min_value=0.0, step=0.1)
-        company_options = company_names["name"].tolist() if not company_names.empty else []
-        company_name = st.selectbox("الشركة", options=company_options)
-        status_options = (
-            sorted(dfs_now["expenses"]["status"].dropna().unique())
-            if not dfs_now["expenses"].empty
-            else []
-        )
+        company_name = st.selectbox("الشركة", options=list(company_ids))
         status_value = st.selectbox("الحالة", options=status_options + ["تم الصرف", "لم يتم"])
         date_value = st.date_input("التاريخ", value=datetime.date.today())
-        if st.button("إضافة المصروف") and expense_number and company_name:
-            company_id = None
-            if not company_names.empty:
-                rec = company_names.loc[company_names["name"] == company_name]
-                if not rec.empty:
-                    company_id = int(rec.iloc[0]["id"])
+        if st.form_submit_button("إضافة المصروف") and expense_number and company_name:
+            company_id = company_ids.get(company_name)
             insert_expense(
                 expense_number, float(amount_val), amount_raw, company_id, status_value, date_value
             )
             st.success("تم إضافة المصروف بنجاح")
             st.cache_data.clear()
+            company_ids = load_company_ids()
+            status_options = load_statuses()
 
-    with st.sidebar.expander("إضافة مبيعات شهرية"):
+    with st.sidebar.expander("إضافة مبيعات شهرية"), st.form("add_sales"):
         month_names = {
             1: "يناير",
             2: "فبراير",
@@ -184,20 +375,23 @@ def main():
         month_num = st.selectbox("الشهر", options=list(month_names.keys()), format_func=lambda x: month_names[x])
         year_num = st.number_input("السنة", value=datetime.date.today().year, step=1)
         sales_amount = st.number_input("قيمة المبيعات", min_value=0.0, step=0.1)
-        if st.button("تسجيل المبيعات"):
+        if st.form_submit_button("تسجيل المبيعات"):
             upsert_sales(int(month_num), int(year_num), float(sales_amount))
             st.success("تم تسجيل المبيعات")
             st.cache_data.clear()
 
-    # Main data
-    dfs = load_data()
-    expenses = dfs["expenses"]
-    companies = dfs["companies"]
-    sales = dfs["sales"]
+    render_explorer(company_ids, status_options)
+
+
+@st.fragment
+def render_explorer(company_ids: dict[str, int], status_options: list[str]):
+    """Filters, table, KPIs, charts and downloads; reruns on its own when only its widgets change."""
+    sales = load_sales()
+    bounds = load_expense_bounds()
 
     st.subheader("عرض البيانات")
 
-    if expenses.empty:
+    if bounds["n"] == 0:
         st.info("لا توجد سجلات مصروفات حتى الآن. يرجى إضافة مصروفات لعرض البيانات.")
         return
 
@@ -205,130 +399,79 @@ def main():
     cols = st.columns(3)
     search_term = cols[0].text_input("بحث عن رقم الصرف أو المبلغ أو الشركة")
     company_filter = (
-        cols[1].selectbox("تصفية بحسب الشركة", options=["الكل"] + companies["name"].tolist())
-        if not companies.empty
+        cols[1].selectbox("تصفية بحسب الشركة", options=["الكل"] + list(company_ids))
+        if company_ids
         else "الكل"
     )
-    status_filter = cols[2].selectbox(
-        "تصفية بحسب الحالة", options=["الكل"] + sorted(expenses["status"].dropna().unique())
-    )
+    status_filter = cols[2].selectbox("تصفية بحسب الحالة", options=["الكل"] + status_options)
 
     # Date range
     date_col1, date_col2 = st.columns(2)
-    min_date = expenses["expense_date"].min() if not expenses["expense_date"].isna().all() else datetime.date.today()
-    max_date = expenses["expense_date"].max() if not expenses["expense_date"].isna().all() else datetime.date.today()
+    min_date = bounds["min_date"] or datetime.date.today()
+    max_date = bounds["max_date"] or datetime.date.today()
     start_date = date_col1.date_input("من تاريخ", value=min_date)
     end_date = date_col2.date_input("إلى تاريخ", value=max_date)
 
-    # Apply filters
-    filtered = expenses.copy()
-    filtered = filtered[(filtered["expense_date"] >= start_date) & (filtered["expense_date"] <= end_date)]
-
-    if search_term:
-        mask = (
-            filtered["expense_number"].astype(str).str.contains(search_term, case=False, na=False)
-            | filtered["amount_raw"].astype(str).str.contains(search_term, case=False, na=False)
-            | filtered["amount"].astype(str).str.contains(search_term, case=False, na=False)
-        )
-        filtered = filtered[mask]
-
-    if company_filter != "الكل" and not companies.empty:
-        cid = companies.loc[companies["name"] == company_filter, "id"].iloc[0]
-        filtered = filtered[filtered["company_id"] == cid]
-
-    if status_filter != "الكل":
-        filtered = filtered[filtered["status"] == status_filter]
+    # Apply filters (in SQL)
+    selected_company_id = None if company_filter == "الكل" else company_ids.get(company_filter)
+    selected_status = None if status_filter == "الكل" else status_filter
+    filter_args = (start_date, end_date, selected_company_id, selected_status, search_term or None)
+    filtered = load_expenses(*filter_args)
 
     # Table
+    # headers are display labels only: no renamed copy of the frame
     st.dataframe(
-        filtered[["id", "expense_number", "amount", "company_id", "status", "expense_date"]].rename(
-            columns={
-                "expense_number": "رقم الصرف",
-                "amount": "المبلغ",
-                "company_id": "الشركة",
-                "status": "الحالة",
-                "expense_date": "التاريخ",
-            }
-        )
+        filtered[["id", "expense_number", "amount", "company_id", "status", "expense_date"]],
+        column_config={
+            "expense_number": "رقم الصرف",
+            "amount": "المبلغ",
+            "company_id": "الشركة",
+            "status": "الحالة",
+            "expense_date": st.column_config.DateColumn("التاريخ"),
+        },
     )
 
     # KPIs
-    total_spent = filtered["amount"].sum()
-    unpaid_total = filtered.loc[filtered["status"] != "تم الصرف", "amount"].sum()
+    # one ndarray for both totals; the unpaid mask compares categorical codes
+    amounts = filtered["amount"].to_numpy(dtype=float)
+    unpaid = (filtered["status"] != "تم الصرف").to_numpy()
+    total_spent = np.nansum(amounts)
+    unpaid_total = np.nansum(amounts[unpaid])
     k1, k2 = st.columns(2)
     k1.metric("إجمالي المصروفات", f"{total_spent:,.2f}")
     k2.metric("إجمالي غير مدفوع", f"{unpaid_total:,.2f}")
 
     # Summaries
-    summary_month = filtered.groupby(["year", "month"])["amount"].sum().reset_index()
-    if not summary_month.empty:
-        summary_month["period"] = summary_month["year"].astype(str) + "-" + summary_month["month"].astype(str).str.zfill(2)
-    summary_company = (
-        filtered.groupby("company_id")["amount"].sum().reset_index().sort_values("amount", ascending=False)
-    )
-    if not summary_company.empty and not companies.empty:
-        summary_company = summary_company.merge(
-            companies[["id", "name"]], left_on="company_id", right_on="id", how="left"
-        )
+    summary_month = summary_by_month(*filter_args)
+    summary_company = summary_by_company(*filter_args)
 
     # ---- Charts ----
     chart_tab1, chart_tab2 = st.tabs(["المصروفات مقابل المبيعات", "أعلى الشركات صرفًا"])
 
     with chart_tab1:
         if not summary_month.empty:
-            # prepare sales summary (period, amount)
-            if sales.empty:
-                sales_summary = pd.DataFrame(columns=["period", "amount"])
-            else:
-                sales_summary = sales[["period", "amount"]].copy()
-
-            merged = summary_month.merge(
-                sales_summary if not sales_summary.empty else pd.DataFrame(columns=["period", "amount"]),
-                on="period",
-                how="left",
-                suffixes=("_expenses", "_sales"),
+            # both sides carry the int period key and always have these columns, even when empty;
+            # summary_month arrives ordered by period and a left merge keeps that order
+            merged = summary_month[["period", "amount"]].merge(
+                sales[["period", "amount"]], on="period", how="left", suffixes=("_expenses", "_sales")
+            )
+            merged["amount_sales"] = merged["amount_sales"].astype(float).fillna(0)
+            merged["period"] = _format_periods(merged["period"])
+
+            st.line_chart(
+                merged.set_index("period")[["amount_expenses", "amount_sales"]].rename(
+                    columns={"amount_expenses": "المصروفات", "amount_sales": "المبيعات"}
+                ),
+                x_label="الفترة (سنة-شهر)",
+                y_label="القيمة",
             )
-
-            # normalize column names (amount_x/amount_y cases)
-            if "amount_expenses" not in merged.columns:
-                if "amount_x" in merged.columns:
-                    merged = merged.rename(columns={"amount_x": "amount_expenses"})
-                elif "amount" in merged.columns:
-                    merged = merged.rename(columns={"amount": "amount_expenses"})
-            if "amount_sales" not in merged.columns and "amount_y" in merged.columns:
-                merged = merged.rename(columns={"amount_y": "amount_sales"})
-
-            merged["amount_expenses"] = pd.to_numeric(merged.get("amount_expenses", 0), errors="coerce").fillna(0)
-            if "amount_sales" in merged.columns:
-                merged["amount_sales"] = pd.to_numeric(merged["amount_sales"], errors="coerce").fillna(0)
-            else:
-                merged["amount_sales"] = 0
-
-            merged = merged.sort_values("period")
-
-            fig, ax = plt.subplots()
-            ax.plot(merged["period"], merged["amount_expenses"], label="المصروفات")
-            if "amount_sales" in merged.columns and not merged["amount_sales"].isna().all():
-                ax.plot(merged["period"], merged["amount_sales"], label="المبيعات")
-            ax.set_title("المصروفات مقابل المبيعات")
-            ax.set_xlabel("الفترة (سنة-شهر)")
-            ax.set_ylabel("القيمة")
-            ax.legend()
-            plt.xticks(rotation=45, ha="right")
-            st.pyplot(fig)
         else:
             st.write("لا توجد بيانات لعرض الرسم")
 
     with chart_tab2:
         if not summary_company.empty:
             top_n = summary_company.head(10)
-            fig, ax = plt.subplots()
-            ax.bar(top_n["name"], top_n["amount"])
-            ax.set_title("أعلى الشركات صرفًا")
-            ax.set_xlabel("الشركة")
-            ax.set_ylabel("القيمة")
-            plt.xticks(rotation=45, ha="right")
-            st.pyplot(fig)
+            st.bar_chart(top_n.set_index("name")["amount"], x_label="الشركة", y_label="القيمة", sort=False)
         else:
             st.write("لا توجد بيانات للعرض")
 
@@ -336,11 +479,15 @@ def main():
     st.subheader("تحميل البيانات")
     st.download_button(
         "تحميل البيانات المحددة (CSV)",
-        data=filtered.to_csv(index=False),
+        data=expenses_csv(*filter_args),
         file_name="expenses_filtered.csv",
         mime="text/csv",
     )
-    sm_csv = summary_month.to_csv(index=False) if not summary_month.empty else ""
+    sm_csv = (
+        summary_month.assign(period=_format_periods(summary_month["period"])).to_csv(index=False)
+        if not summary_month.empty
+        else ""
+    )
     if sm_csv:
         st.download_button("تحميل ملخص شهري (CSV)", sm_csv, "summary_month.csv", mime="text/csv")
     if not summary_company.empty: